@@ -1,13 +1,23 @@
 from __future__ import annotations
 
+import hashlib
+import mimetypes
 import os
+import posixpath
+import re
+import threading
 import time
+from functools import lru_cache
 from pathlib import Path
 from urllib.parse import quote
 
+import orjson
 import requests
 from dotenv import load_dotenv
-from flask import Flask, Response, abort, jsonify, redirect, render_template_string, request, send_from_directory
+from flask import Flask, Response, abort, g, jsonify, redirect, request, send_from_directory
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from werkzeug.security import safe_join
 
 BASE_DIR = Path(__file__).resolve().parent
 WEB_DIR = BASE_DIR.parent / "web"
@@ -23,9 +33,42 @@ GITHUB_API_URL = (
 )
 
 CACHE_TTL = int(os.getenv("GITHUB_CACHE_TTL", "300"))
-_cache = {"timestamp": 0.0, "data": None}
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+_cache = {
+    "timestamp": 0.0,
+    "data": None,
+    "model_versions": None,
+    "payload": None,
+}
+_sitemap_cache = {"entry": None}
+_homepage_cache: dict[str, bytes] = {}
+_refresh_lock = threading.Lock()
+
+_session = requests.Session()
+_session.headers.update({"Accept": "application/vnd.github+json"})
+if GITHUB_TOKEN:
+    _session.headers["Authorization"] = f"Bearer {GITHUB_TOKEN}"
+_session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=10,
+        max_retries=Retry(
+            total=2,
+            read=0,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            raise_on_status=False,
+        ),
+    ),
+)
+
+app = Flask(__name__, static_folder=None)
 
-app = Flask(__name__, static_folder=str(WEB_DIR), static_url_path="")
+_INDEX_TPL = app.jinja_env.from_string(INDEX_TEMPLATE)
+_DIFF_TPL = app.jinja_env.from_string(DIFF_TEMPLATE)
+_NOT_FOUND_TPL = app.jinja_env.from_string(NOT_FOUND_TEMPLATE)
 
 
 BASE_TITLE = "Aspect Models for Eclipse Tractus-X Semantic Layer (SLDT)"
@@ -33,11 +76,45 @@ BASE_DESCRIPTION = (
     "Explore Aspect Models for the Eclipse Tractus-X Semantic Layer (SLDT) and align on shared data contracts."
 )
 OG_IMAGE_PATH = "/assets/mindbehindit-og.webp"
-ALLOWED_STATIC_FILES = {"app.js", "diff.js", "styles.css"}
-ALLOWED_STATIC_DIRS = {"assets", "vendor"}
+ALLOWED_STATIC_FILES = frozenset({"app.js", "diff.js", "styles.css"})
+ALLOWED_STATIC_DIRS = frozenset({"assets", "vendor"})
+_ALLOWED_DIR_PREFIXES = tuple(f"{directory}/" for directory in ALLOWED_STATIC_DIRS)
+_SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "SAMEORIGIN",
+    "X-Permitted-Cross-Domain-Policies": "none",
+    "Referrer-Policy": "strict-origin-when-cross-origin",
+    "Permissions-Policy": "geolocation=(), microphone=(), camera=()",
+    "Cross-Origin-Opener-Policy": "same-origin",
+    "Cross-Origin-Resource-Policy": "same-origin",
+    "Content-Security-Policy": (
+        "default-src 'self'; "
+        "connect-src 'self' https://api.github.com https://raw.githubusercontent.com; "
+        "img-src 'self' data: https://raw.githubusercontent.com; "
+        "style-src 'self'; "
+        "font-src 'self'; "
+        "script-src 'self'; "
+        "object-src 'none'; "
+        "base-uri 'self'; "
+        "frame-ancestors 'self'"
+    ),
+}
+_STATIC_SECURITY_HEADERS = {
+    name: _SECURITY_HEADERS[name]
+    for name in ("X-Content-Type-Options", "Referrer-Policy", "Cross-Origin-Resource-Policy")
+}
+_DOCUMENT_MIMETYPES = frozenset({"text/html", "image/svg+xml"})
+_SITEMAP_HEADER = (
+    b'<?xml version="1.0" encoding="UTF-8"?>\n'
+    b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+)
+_SITEMAP_FOOTER = b"</urlset>"
+_GEN_RE = re.compile(r"^([^/]+)/([^/]+)/gen/.*\.html\Z")
+_NAME_RE = re.compile(r"^[A-Za-z0-9._-]{1,128}\Z")
 
 
-def _page_meta(model: str | None = None, version: str | None = None) -> dict[str, str]:
+@lru_cache(maxsize=4096)
+def _page_titles(model: str | None, version: str | None) -> tuple[str, str]:
     if model and version:
         title = f"{model} v{version} | {BASE_TITLE}"
         description = (
@@ -53,6 +130,11 @@ def _page_meta(model: str | None = None, version: str | None = None) -> dict[str
     else:
         title = BASE_TITLE
         description = BASE_DESCRIPTION
+    return title, description
+
+
+def _page_meta(model: str | None = None, version: str | None = None) -> dict[str, str]:
+    title, description = _page_titles(model, version)
     base_url = _external_base_url()
     canonical_url = f"{base_url}{request.path}"
     og_image_url = f"{base_url}{OG_IMAGE_PATH}"
@@ -65,10 +147,11 @@ def _page_meta(model: str | None = None, version: str | None = None) -> dict[str
 
 
 def _render_index(model: str | None = None, version: str | None = None):
-    return render_template_string(INDEX_TEMPLATE, **_page_meta(model, version))
+    return _INDEX_TPL.render(**_page_meta(model, version))
 
 
-def _diff_meta(model: str | None, source: str | None, target: str | None) -> dict[str, str]:
+@lru_cache(maxsize=4096)
+def _diff_titles(model: str | None, source: str | None, target: str | None) -> tuple[str, str]:
     if model and source and target:
         title = f"Diff {model} {source} to {target} | {BASE_TITLE}"
         description = (
@@ -85,6 +168,13 @@ def _diff_meta(model: str | None, source: str | None, target: str | None) -> dic
         description = (
             "Compare semantic model versions in the Eclipse Tractus-X Semantic Layer (SLDT)."
         )
+    return title, description
+
+
+def _diff_meta(model: str | None, source: str | None, target: str | None) -> dict[str, str]:
+    if not model:
+        source = target = None
+    title, description = _diff_titles(model, source, target)
     base_url = _external_base_url()
     canonical_url = f"{base_url}{request.path}"
     og_image_url = f"{base_url}{OG_IMAGE_PATH}"
@@ -96,14 +186,23 @@ def _diff_meta(model: str | None, source: str | None, target: str | None) -> dic
     }
 
 
+def _render_home():
+    if not PUBLIC_BASE_URL or _external_base_url() != PUBLIC_BASE_URL:
+        return _render_index()
+    body = _homepage_cache.get(request.path)
+    if body is None:
+        body = _homepage_cache[request.path] = _render_index().encode("utf-8")
+    return Response(body, mimetype="text/html")
+
+
 @app.get("/")
 def index():
-    return _render_index()
+    return _render_home()
 
 
 @app.get("/index.html")
 def index_file():
-    return _render_index()
+    return _render_home()
 
 
 @app.get("/models/<path:model>")
@@ -126,7 +225,7 @@ def diff():
             abort(404)
         if target and not _is_valid_model_version(model, target):
             abort(404)
-    return render_template_string(DIFF_TEMPLATE, **_diff_meta(model, source, target))
+    return _DIFF_TPL.render(**_diff_meta(model, source, target))
 
 
 @app.get("/diff.html")
@@ -149,68 +248,85 @@ def models():
             ),
             status,
         )
-    return jsonify({"tree": tree, "cached": cached})
+    etag, json_cached, json_fresh = _cache["payload"]
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        body = json_cached if cached else json_fresh
+        response = Response(body, status=200, mimetype="application/json")
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = f"public, max-age={CACHE_TTL}"
+    return response
 
 
 @app.get("/<path:resource>")
 def assets(resource: str):
-    path = Path(resource)
-    if not path.parts:
+    blob = _STATIC_BLOBS.get(resource)
+    if blob is not None and not app.debug:
+        body, mimetype, etag = blob
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request, accept_ranges=True, complete_length=len(body))
+    resource = posixpath.normpath(resource)
+    if not (resource.startswith(_ALLOWED_DIR_PREFIXES) or resource in ALLOWED_STATIC_FILES):
+        abort(404)
+    path = safe_join(str(WEB_DIR), resource)
+    if path is None:
         abort(404)
-    if path.parts[0] in ALLOWED_STATIC_DIRS:
-        return send_from_directory(WEB_DIR, resource)
-    if resource in ALLOWED_STATIC_FILES:
-        return send_from_directory(WEB_DIR, resource)
-    abort(404)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        abort(404)
+    etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+    return send_from_directory(WEB_DIR, resource, etag=etag)
 
 
 @app.get("/sitemap.xml")
 def sitemap():
-    tree, _, _ = _fetch_tree(fallback_to_cache=True)
-    tree = tree or []
-    model_versions = _build_model_versions(tree)
+    timestamp, model_versions = _get_model_versions() or (0.0, {})
     base_url = _external_base_url()
+    key = (base_url, timestamp)
+    entry = _sitemap_cache["entry"]
+    if entry is not None and entry[0] == key:
+        return Response(entry[1], status=200, mimetype="application/xml")
+
+    items = sorted(
+        (quote(model), [quote(version) for version in sorted(versions)])
+        for model, versions in model_versions.items()
+    )
     urls = ["/", "/diff"]
-    for model in sorted(model_versions):
-        urls.append(f"/models/{quote(model)}")
-        for version in sorted(model_versions[model]):
-            urls.append(f"/models/{quote(model)}/versions/{quote(version)}")
-
-    lines = [
-        "<?xml version=\"1.0\" encoding=\"UTF-8\"?>",
-        "<urlset xmlns=\"http://www.sitemaps.org/schemas/sitemap/0.9\">",
-    ]
+    for quoted_model, quoted_versions in items:
+        urls.append(f"/models/{quoted_model}")
+        urls.extend(f"/models/{quoted_model}/versions/{quoted_version}" for quoted_version in quoted_versions)
+
+    buf = bytearray(_SITEMAP_HEADER)
     for path in urls:
-        lines.append("  <url>")
-        lines.append(f"    <loc>{base_url}{path}</loc>")
-        lines.append("  </url>")
-    lines.append("</urlset>")
-    xml_body = "\n".join(lines)
+        buf.extend(f"  <url>\n    <loc>{base_url}{path}</loc>\n  </url>\n".encode("utf-8"))
+    buf.extend(_SITEMAP_FOOTER)
+    xml_body = bytes(buf)
+    _sitemap_cache["entry"] = (key, xml_body)
     return Response(xml_body, status=200, mimetype="application/xml")
 
 
+@app.before_request
+def reset_base_url():
+    g._base_url = None
+
+
 @app.after_request
 def add_security_headers(response):
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "SAMEORIGIN"
-    response.headers["X-Permitted-Cross-Domain-Policies"] = "none"
-    response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-    response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
-    response.headers["Cross-Origin-Opener-Policy"] = "same-origin"
-    response.headers["Cross-Origin-Resource-Policy"] = "same-origin"
-    response.headers[
-        "Content-Security-Policy"
-    ] = (
-        "default-src 'self'; "
-        "connect-src 'self' https://api.github.com https://raw.githubusercontent.com; "
-        "img-src 'self' data: https://raw.githubusercontent.com; "
-        "style-src 'self'; "
-        "font-src 'self'; "
-        "script-src 'self'; "
-        "object-src 'none'; "
-        "base-uri 'self'; "
-        "frame-ancestors 'self'"
-    )
+    if response.status_code == 304 or (
+        request.endpoint == "assets" and response.mimetype not in _DOCUMENT_MIMETYPES
+    ):
+        response.headers.update(_STATIC_SECURITY_HEADERS)
+    else:
+        response.headers.update(_SECURITY_HEADERS)
     if request.is_secure or request.headers.get("X-Forwarded-Proto", "").startswith("https"):
         response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
     return response
@@ -227,59 +343,74 @@ def not_found(error):
         "canonical_url": canonical_url,
         "og_image_url": og_image_url,
     }
-    return render_template_string(NOT_FOUND_TEMPLATE, **payload), 404
+    return _NOT_FOUND_TPL.render(**payload), 404
 
 
 def _fetch_tree(fallback_to_cache: bool = False):
-    now = time.time()
-    if _cache["data"] and now - _cache["timestamp"] < CACHE_TTL:
+    if _cache["data"] and time.time() - _cache["timestamp"] < CACHE_TTL:
         return _cache["data"], True, None
 
-    token = os.getenv("GITHUB_TOKEN")
-    headers = {"Accept": "application/vnd.github+json"}
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
-
-    response = requests.get(GITHUB_API_URL, headers=headers, timeout=30)
-    if response.status_code != 200:
-        if fallback_to_cache and _cache["data"]:
+    if _cache["data"]:
+        if not _refresh_lock.acquire(blocking=False):
+            return _cache["data"], True, None
+    else:
+        _refresh_lock.acquire()
+    try:
+        now = time.time()
+        if _cache["data"] and now - _cache["timestamp"] < CACHE_TTL:
             return _cache["data"], True, None
-        return None, False, (response.status_code, response.json())
-
-    tree = response.json().get("tree", [])
-    _cache["timestamp"] = now
-    _cache["data"] = tree
-    return tree, False, None
-
 
-def _build_model_versions(tree: list[dict]) -> dict[str, set[str]]:
+        response = _session.get(GITHUB_API_URL, timeout=30)
+        if response.status_code != 200:
+            if fallback_to_cache and _cache["data"]:
+                return _cache["data"], True, None
+            return None, False, (response.status_code, response.json())
+
+        tree = [
+            entry["path"]
+            for entry in response.json().get("tree", [])
+            if entry.get("type") == "blob" and entry.get("path")
+        ]
+        _cache["model_versions"] = (now, _build_model_versions(tree))
+        json_fresh = _models_payload(tree, cached=False)
+        etag = hashlib.blake2b(json_fresh, digest_size=16).hexdigest()
+        _cache["payload"] = (etag, _models_payload(tree, cached=True), json_fresh)
+        _cache["data"] = tree
+        _cache["timestamp"] = now
+        return tree, False, None
+    finally:
+        _refresh_lock.release()
+
+
+def _build_model_versions(tree: list[str]) -> dict[str, set[str]]:
     models: dict[str, set[str]] = {}
-    for entry in tree:
-        if entry.get("type") != "blob":
-            continue
-        path = entry.get("path") or ""
-        if "/gen/" not in path:
-            continue
-        parts = path.split("/")
-        if len(parts) < 4:
-            continue
-        model, version, segment = parts[0], parts[1], parts[2]
-        if segment != "gen":
-            continue
-        filename = parts[-1]
-        if not filename.endswith(".html"):
-            continue
-        models.setdefault(model, set()).add(version)
+    for path in tree:
+        match = _GEN_RE.match(path)
+        if match:
+            models.setdefault(match.group(1), set()).add(match.group(2))
     return models
 
 
-def _is_valid_model_version(model: str | None, version: str | None) -> bool:
-    if not model:
-        return False
+def _models_payload(tree: list[str], cached: bool) -> bytes:
+    return orjson.dumps({"tree": tree, "cached": cached})
+
+
+def _get_model_versions() -> tuple[float, dict[str, set[str]]] | None:
     tree, _, _ = _fetch_tree(fallback_to_cache=True)
     if not tree:
+        return None
+    return _cache["model_versions"]
+
+
+def _is_valid_model_version(model: str | None, version: str | None) -> bool:
+    if not model or not _NAME_RE.match(model):
+        return False
+    if version and not _NAME_RE.match(version):
+        return False
+    snapshot = _cache["model_versions"]
+    if not _cache["data"] or snapshot is None:
         return True
-    model_versions = _build_model_versions(tree)
+    _, model_versions = snapshot
     if model not in model_versions:
         return False
     if version and version not in model_versions[model]:
@@ -288,11 +419,24 @@ def _is_valid_model_version(model: str | None, version: str | None) -> bool:
 
 
 def _external_base_url() -> str:
-    scheme = request.headers.get("X-Forwarded-Proto", request.scheme)
-    scheme = scheme.split(",")[0].strip() or "https"
-    host = request.headers.get("X-Forwarded-Host", request.host)
-    host = host.split(",")[0].strip()
-    return f"{scheme}://{host}"
+    base_url = getattr(g, "_base_url", None)
+    if base_url is None:
+        scheme = request.headers.get("X-Forwarded-Proto", request.scheme)
+        scheme = scheme.split(",")[0].strip() or "https"
+        host = request.headers.get("X-Forwarded-Host", request.host)
+        host = host.split(",")[0].strip()
+        base_url = g._base_url = f"{scheme}://{host}"
+    return base_url
+
+
+def _load_static_blob(name: str) -> tuple[bytes, str, str]:
+    path = WEB_DIR / name
+    stat = path.stat()
+    mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return path.read_bytes(), mimetype, f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+_STATIC_BLOBS = {name: _load_static_blob(name) for name in ALLOWED_STATIC_FILES}
 
 
 if __name__ == "__main__":
@@ -58,8 +58,6 @@ const renderStatus = (message) => {
 const buildModels = (paths) => {
   const modelMap = new Map();
   paths
-    .filter((entry) => entry.type === "blob")
-    .map((entry) => entry.path)
     .filter((path) => path.includes("/gen/"))
     .forEach((path) => {
       const [model, version, segment, file] = path.split("/");
@@ -38,8 +38,6 @@ const titleCase = (value) =>
 const buildModels = (paths) => {
   const modelMap = new Map();
   paths
-    .filter((entry) => entry.type === "blob")
-    .map((entry) => entry.path)
     .filter((path) => path.includes("/gen/") || path.endsWith(".ttl"))
     .forEach((path) => {
       const [model, version, segment, file] = path.split("/");